@@ -1,10 +1,18 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import lxml.html
+from lxml import etree
 from urllib.parse import urljoin, urlparse
-import xml.etree.ElementTree as ET
+from urllib.robotparser import RobotFileParser
+import codecs
 import gzip
-import io
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 
 # -------------------------
 # Globals / Headers
@@ -19,6 +27,37 @@ HEADERS = {
     "Accept-Language": "en-US,en;q=0.8",
 }
 
+# One shared session so every request to the site reuses pooled keep-alive connections,
+# retrying transient failures / rate limits with backoff instead of silently losing the page
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET", "HEAD"),
+    # a rate-limited site may ask for minutes (Retry-After); a crawl worker must not sleep that
+    # long, so only the short exponential backoff above applies
+    respect_retry_after_header=False,
+)
+_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=_RETRY)
+SESSION.mount("https://", _ADAPTER)
+SESSION.mount("http://", _ADAPTER)
+
+# How many pages are fetched at once while crawling (kept within the pool size above)
+CRAWL_WORKERS = 16
+
+# Fetched pages and sitemaps are memoised across Streamlit reruns for this long (seconds)
+CACHE_TTL = 3600
+
+# Pages larger than this are truncated before parsing; anything non-HTML is never parsed
+MAX_HTML_BYTES = 2_000_000
+# ...and stop reading once this many links are seen (search/archive pages can hold 10k+)
+MAX_ANCHORS = 2000
+# Content-Types worth reading for robots.txt / sitemaps (HTML here is usually a soft-404 page)
+SITEMAP_CONTENT_TYPES = ("xml", "gzip", "text/plain", "octet-stream")
+
+@lru_cache(maxsize=8192)
 def _norm_netloc(u: str) -> str:
     try:
         n = urlparse(u).netloc.lower()
@@ -26,83 +65,173 @@ def _norm_netloc(u: str) -> str:
     except Exception:
         return ""
 
-def _same_host(a: str, b: str) -> bool:
-    return _norm_netloc(a) == _norm_netloc(b)
+def _site_prefixes(url: str):
+    """Return (prefixes, roots) that are certainly on the same host as url, for both schemes and www."""
+    host = _norm_netloc(url)
+    roots = tuple(f"{scheme}://{h}" for scheme in ("https", "http") for h in (host, "www." + host))
+    prefixes = tuple(r + sep for r in roots for sep in ("/", "?"))
+    return prefixes, frozenset(roots)
 
-def _is_http_url(href: str) -> bool:
-    if not href:
-        return False
-    href = href.strip()
-    if href.startswith(("mailto:", "tel:", "javascript:", "#")):
-        return False
-    return href.startswith(("http://", "https://", "/"))
+def _content_type(resp) -> str:
+    return (resp.headers.get("Content-Type") or "").lower()
+
+def _header_charset(resp):
+    """Return the charset= from the Content-Type header, or None if absent/unknown."""
+    # get_encoding_from_headers() defaults text/* to ISO-8859-1, so only trust an explicit charset
+    if "charset=" not in _content_type(resp):
+        return None
+    encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    try:
+        codecs.lookup(encoding)
+    except (LookupError, TypeError):
+        return None
+    return encoding
+
+def _parse_html_capped(resp):
+    """Parse a streamed HTML response as it arrives, stopping at MAX_HTML_BYTES or MAX_ANCHORS links."""
+    # without a header charset lxml only sees <meta charset> and otherwise falls back to Latin-1
+    parser = etree.HTMLPullParser(events=("end",), tag="a", encoding=_header_charset(resp))
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    read = anchors = 0
+    for chunk in resp.iter_content(65536):
+        parser.feed(chunk[:MAX_HTML_BYTES - read])
+        read += len(chunk)
+        anchors += sum(1 for _, a in parser.read_events() if a.get("href") is not None)
+        if read >= MAX_HTML_BYTES or anchors >= MAX_ANCHORS:
+            break
+    return parser.close()
+
+# <a href> whose raw href is an http(s) URL or a root-relative path (so no mailto:, tel:,
+# javascript:, bare #fragment, ...); compiled once and evaluated in C
+_HTTP_ANCHORS = etree.XPath(
+    "//a[starts-with(normalize-space(@href), 'http://')"
+    " or starts-with(normalize-space(@href), 'https://')"
+    " or starts-with(normalize-space(@href), '/')]"
+)
 
 # -------------------------
 # Extract internal links from a given URL (used by both features)
 # -------------------------
-def get_internal_links(base_url):
-    try:
-        response = requests.get(base_url, headers=HEADERS, timeout=15, allow_redirects=True)
-        if response.status_code != 200 or not response.text:
+def _fetch_internal_links(base_url):
+    """Fetch base_url and return its same-host (href, anchor) pairs; raises on network/HTTP errors."""
+    # stream so the body is only downloaded once we know it is HTML
+    with SESSION.get(base_url, timeout=15, allow_redirects=True, stream=True) as response:
+        response.raise_for_status()
+        ct = _content_type(response)
+        if response.status_code != 200 or (ct and "html" not in ct):
             return []
-        soup = BeautifulSoup(response.text, 'html.parser')
-        links = []
-
-        for a in soup.find_all('a', href=True):
-            if not _is_http_url(a['href']):
+        doc = _parse_html_capped(response)
+    base_host = _norm_netloc(base_url)
+    prefixes, roots = _site_prefixes(base_url)
+    # pick anchors on their raw href, then resolve every link in one pass
+    anchors = _HTTP_ANCHORS(doc)[:MAX_ANCHORS]
+    doc.make_links_absolute(base_url, resolve_base_href=True)
+    # nav/footer templates repeat the same link; keep each (href, anchor) once, in page order
+    seen = set()
+    links = []
+
+    for a in anchors:
+        href = a.get('href').partition('#')[0]
+        # cheap prefix test first; urlparse only for hrefs it can't vouch for (other hosts, odd casing)
+        if href.startswith(prefixes) or href in roots or _norm_netloc(href) == base_host:
+            key = (href, a.text_content().strip())
+            if key in seen:
                 continue
-            href = urljoin(base_url, a['href']).split('#')[0]
-            if _same_host(href, base_url):
-                anchor = a.get_text(strip=True)
-                links.append((href, anchor))
-        return links
+            seen.add(key)
+            links.append(key)
+    return links
+
+# exceptions are not cached, so a failed fetch is retried on the next call instead of
+# hiding the page for CACHE_TTL
+_cached_internal_links = st.cache_data(ttl=CACHE_TTL, max_entries=2000, show_spinner=False)(
+    _fetch_internal_links
+)
+
+def get_internal_links(base_url, refresh=False):
+    try:
+        if refresh:
+            # drop just this URL's cached entry so it is fetched again
+            _cached_internal_links.clear(base_url)
+        return _cached_internal_links(base_url)
     except Exception:
         return []
 
+def _crawl_pool():
+    """Thread pool for page fetches whose workers share this script run's context, so the
+    cached get_internal_links works there without a "missing ScriptRunContext" warning per call."""
+    ctx = get_script_run_ctx()
+    return ThreadPoolExecutor(
+        max_workers=CRAWL_WORKERS,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    )
+
+CATEGORY_KEYWORDS = {
+    "Blog Pages": "/blog",
+    "Blog Categories": "/category",
+    "Product Pages": ["/product", "/products"],
+    "All Pages": None
+}
+
+def _category_matcher(selected_category):
+    """Build the URL test for a category once, so the crawl loop doesn't re-dispatch per link."""
+    match_keywords = CATEGORY_KEYWORDS.get(selected_category)
+    if selected_category == "All Pages":
+        return lambda u: True
+    if isinstance(match_keywords, list):
+        kws = tuple(match_keywords)
+        return lambda u: any(kw in u for kw in kws)
+    if isinstance(match_keywords, str):
+        return lambda u: match_keywords in u
+    return lambda u: False
+
 # -------------------------
-# Crawl pages only from the selected category (unchanged logic, but with headers)
+# Crawl pages only from the selected category (sitemap-first, HTML crawl as fallback)
 # -------------------------
-def crawl_filtered_pages(home_url, selected_category, max_pages=300):
-    visited = set()
-    queue = [home_url.rstrip('/')]
+def crawl_filtered_pages(home_url, selected_category, max_pages=300, refresh=False):
+    # refresh=True re-fetches everything this crawl touches instead of using cached copies
+    if refresh:
+        # robots.txt feeds both the Sitemap: list and the allow rules, so refresh it too
+        _fetch_robots_txt.clear(home_url)
+        _collect_urls_from_sitemaps.clear(home_url)
+    fetch = partial(get_internal_links, refresh=refresh)
+    in_category = _category_matcher(selected_category)
+    allowed = _robots_checker(home_url)
+
+    # 1) Sitemap: category pages are usually listed directly, so only those need fetching
+    try:
+        sitemap_urls = _collect_urls_from_sitemaps(home_url)
+    except Exception:
+        sitemap_urls = []
+    pages = [u for u in sitemap_urls if in_category(u) and allowed(u)][:max_pages]
+    if pages:
+        with _crawl_pool() as pool:
+            return list(zip(pages, pool.map(fetch, pages)))
+
+    # 2) Fallback: breadth-first HTML crawl from the homepage
+    start = home_url.rstrip('/')
+    # crawl level by level: only the current BFS frontier is held, never a monolithic queue
+    frontier = [start]
+    seen = {start}
+    fetched = 0
     results = []
 
-    category_keywords = {
-        "Blog Pages": "/blog",
-        "Blog Categories": "/category",
-        "Product Pages": ["/product", "/products"],
-        "All Pages": None
-    }
-    match_keywords = category_keywords.get(selected_category)
-
-    while queue and len(visited) < max_pages:
-        url = queue.pop(0)
-        if url in visited:
-            continue
-        visited.add(url)
-
-        links = get_internal_links(url)
-
-        # record result if page itself matches the chosen category (or "All Pages")
-        if selected_category == "All Pages" or (
-            isinstance(match_keywords, list) and any(kw in url for kw in match_keywords)
-        ) or (
-            isinstance(match_keywords, str) and match_keywords in url
-        ):
-            results.append((url, links))
-
-        # queue traversal policy
-        for link, _ in links:
-            if link in visited or link in queue:
-                continue
-            if selected_category == "All Pages":
-                queue.append(link)
-            elif isinstance(match_keywords, list):
-                if any(kw in link for kw in match_keywords):
-                    queue.append(link)
-            elif isinstance(match_keywords, str):
-                if match_keywords in link:
-                    queue.append(link)
+    with _crawl_pool() as pool:
+        while frontier and fetched < max_pages:
+            frontier = frontier[:max_pages - fetched]
+            fetched += len(frontier)
+            next_frontier = []
+            # fetch the whole frontier concurrently; results come back in frontier order
+            for url, links in zip(frontier, pool.map(fetch, frontier)):
+                # record result if page itself matches the chosen category (or "All Pages")
+                if in_category(url):
+                    results.append((url, links))
+
+                # frontier traversal policy
+                for link, _ in links:
+                    if link not in seen and in_category(link) and allowed(link):
+                        seen.add(link)
+                        next_frontier.append(link)
+            frontier = next_frontier
 
     return results
 
@@ -116,51 +245,86 @@ def crawl_filtered_pages(home_url, selected_category, max_pages=300):
 # -------------------------
 def _fetch_text(url):
     try:
-        r = requests.get(url, headers=HEADERS, timeout=20, allow_redirects=True)
-        if r.status_code == 200:
+        r = SESSION.get(url, timeout=20, allow_redirects=True, stream=True)
+        ct = _content_type(r)
+        if r.status_code == 200 and (not ct or any(t in ct for t in SITEMAP_CONTENT_TYPES)):
             return r
+        r.close()
     except Exception:
         pass
     return None
 
-def _read_xml_text(resp, url):
-    """Return XML text; handle gzipped sitemaps."""
-    if resp is None:
-        return None
+def _open_xml_stream(resp, url):
+    """Return a file-like over the XML body, read straight off the socket; handle gzipped sitemaps."""
+    # let urllib3 undo any Content-Encoding (transport gzip/deflate) while we read
+    resp.raw.decode_content = True
+    ct = _content_type(resp)
+    if url.lower().endswith(".gz") or "gzip" in ct or "x-gzip" in ct:
+        # Decompress .gz on the fly
+        return gzip.GzipFile(fileobj=resp.raw)
+    # plain xml/text
+    return resp.raw
+
+def _parse_sitemap_xml(xml_source):
+    """Return (root_tag, list_of_text_in_loc_tags), streaming so no full DOM is kept.
+
+    Only the sitemap-protocol <loc> of a <url>/<sitemap> entry counts; extension locs such as
+    <image:loc> or <video:loc> (nested one level deeper) are skipped.
+    """
+    root_tag = None
+    locs = []
     try:
-        ct = (resp.headers.get("Content-Type") or "").lower()
-        if url.lower().endswith(".gz") or "gzip" in ct or "x-gzip" in ct:
-            # Decompress .gz
-            data = io.BytesIO(resp.content)
-            with gzip.GzipFile(fileobj=data) as gz:
-                return gz.read().decode("utf-8", errors="replace")
-        # plain xml/text
-        if resp.text:
-            return resp.text
+        for _, el in etree.iterparse(xml_source, events=("end",), tag="{*}loc",
+                                     huge_tree=True, resolve_entities=False):
+            if root_tag is None:
+                # namespace-agnostic tag name
+                root_tag = etree.QName(el.getroottree().getroot()).localname.lower()
+            entry = el.getparent()
+            if el.text and entry is not None and etree.QName(entry).localname in ("url", "sitemap"):
+                locs.append(el.text.strip())
+            # drop finished <url>/<sitemap> entries so memory stays flat
+            el.clear()
+            while entry is not None and entry.getprevious() is not None:
+                del entry.getparent()[0]
     except Exception:
-        return None
-    return None
-
-def _parse_sitemap_xml(xml_text):
-    """Return (root_tag, list_of_text_in_loc_tags)."""
+        return None, []
+    return root_tag, locs
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _fetch_robots_txt(home_url):
+    """Return the site's robots.txt body ('' if it has none); fetched once for rules and sitemaps.
+
+    Raises on network errors / 5xx so a failed fetch isn't cached as "no robots.txt".
+    """
+    with SESSION.get(urljoin(home_url, "/robots.txt"), timeout=20, allow_redirects=True) as resp:
+        # 4xx means there is no usable robots.txt, i.e. no restrictions
+        if 400 <= resp.status_code < 500:
+            return ""
+        resp.raise_for_status()
+        # an HTML page here is a soft-404, not a robots.txt
+        if "html" in _content_type(resp):
+            return ""
+        return resp.text or ""
+
+def _robots_txt(home_url):
+    """Cached robots.txt body, or '' (allow all, no sitemaps) if it couldn't be fetched."""
     try:
-        root = ET.fromstring(xml_text)
+        return _fetch_robots_txt(home_url)
     except Exception:
-        return None, []
-    # namespace-agnostic tag name
-    tag = root.tag.lower()
-    if '}' in tag:
-        tag = tag.split('}', 1)[1]
-    locs = [el.text.strip() for el in root.findall(".//{*}loc") if el.text]
-    return tag, locs
+        return ""
+
+def _robots_checker(home_url):
+    """Return a url -> bool test honouring robots.txt rules for User-agent: *."""
+    rp = RobotFileParser()
+    rp.parse(_robots_txt(home_url).splitlines())
+    return lambda u: rp.can_fetch("*", u)
 
 def _discover_sitemaps_from_robots(home_url):
     # robots.txt can list sitemaps
-    robots_url = urljoin(home_url, "/robots.txt")
-    resp = _fetch_text(robots_url)
+    robots_txt = _robots_txt(home_url)
     sitemaps = []
-    if resp and resp.text:
-        for line in resp.text.splitlines():
+    if robots_txt:
+        for line in robots_txt.splitlines():
             if line.lower().startswith("sitemap:"):
                 sm = line.split(":", 1)[1].strip()
                 if sm:
@@ -188,7 +352,7 @@ def _filter_same_site_urls(urls, home_url):
         try:
             if _norm_netloc(u) == base:
                 # normalize: drop fragment; keep path/query (often important)
-                filtered.append(u.split("#")[0].strip())
+                filtered.append(u.partition("#")[0].strip())
         except Exception:
             continue
     # de-dup while keeping order
@@ -200,24 +364,28 @@ def _filter_same_site_urls(urls, home_url):
             seen.add(u)
     return out
 
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
 def _collect_urls_from_sitemaps(home_url, visit_limit=30_000):
-    """Follow sitemap index → nested sitemaps → URL sets. Returns list of URLs for same host."""
-    to_visit = _candidate_sitemap_urls(home_url)
+    """Follow sitemap index → nested sitemaps → URL sets. Returns list of URLs for same host.
+
+    Raises LookupError when nothing is found, so an unreachable sitemap isn't cached as empty.
+    """
+    to_visit = deque(_candidate_sitemap_urls(home_url))
     seen_sitemaps = set()
     found_urls = []
 
     while to_visit and len(found_urls) < visit_limit:
-        sm_url = to_visit.pop(0)
+        sm_url = to_visit.popleft()
         if sm_url in seen_sitemaps:
             continue
         seen_sitemaps.add(sm_url)
 
         resp = _fetch_text(sm_url)
-        xml_text = _read_xml_text(resp, sm_url)
-        if not xml_text:
+        if resp is None:
             continue
-
-        root_tag, locs = _parse_sitemap_xml(xml_text)
+        # response -> (gunzip) -> iterparse in one pass, without buffering the whole body
+        with resp:
+            root_tag, locs = _parse_sitemap_xml(_open_xml_stream(resp, sm_url))
         if not locs:
             continue
 
@@ -240,6 +408,8 @@ def _collect_urls_from_sitemaps(home_url, visit_limit=30_000):
         if u not in seen:
             ordered.append(u)
             seen.add(u)
+    if not ordered:
+        raise LookupError(f"no sitemap URLs found for {home_url}")
     return ordered
 
 # -------------------------
@@ -265,20 +435,22 @@ def find_all_internal_urls(home_url, max_pages=500):
 
     # 2) Fallback: lightweight crawl using your existing logic
     all_urls = set()
-    visited = set()
-    queue = [home_url.rstrip('/')]
-
-    while queue and len(visited) < max_pages:
-        url = queue.pop(0)
-        if url in visited:
-            continue
-        visited.add(url)
-
-        links = get_internal_links(url)
-        for link, _ in links:
-            if link not in visited and link not in queue:
-                queue.append(link)
-        all_urls.add(url)
+    start = home_url.rstrip('/')
+    frontier = [start]
+    seen = {start}
+    allowed = _robots_checker(home_url)
+
+    with _crawl_pool() as pool:
+        while frontier and len(all_urls) < max_pages:
+            frontier = frontier[:max_pages - len(all_urls)]
+            next_frontier = []
+            for url, links in zip(frontier, pool.map(get_internal_links, frontier)):
+                for link, _ in links:
+                    if link not in seen and allowed(link):
+                        seen.add(link)
+                        next_frontier.append(link)
+                all_urls.add(url)
+            frontier = next_frontier
 
     # Keep only same host and return sorted
     keep = _filter_same_site_urls(sorted(all_urls), home_url)
@@ -307,27 +479,40 @@ category_choice = st.selectbox(
 )
 
 target_input = st.text_area("🎯 Enter target URLs (separate by commas or new lines):")
-target_urls = [url.strip().rstrip('/') for url in target_input.replace(',', '\n').splitlines() if url.strip()]
+# normalised (trailing slash dropped) and de-duplicated, keeping input order
+target_urls = list(dict.fromkeys(
+    url.strip().rstrip('/') for url in target_input.replace(',', '\n').splitlines() if url.strip()
+))
+
+recrawl = st.checkbox("🔄 Re-crawl the site (ignore results from earlier checks)")
 
 if st.button("Check Interlinking Pages"):
     if not home_url or not target_urls:
         st.error("❗ Please enter both the homepage and at least one target URL.")
     else:
-        with st.spinner(f"🚀 Crawling up to 300 pages from {category_choice}..."):
-            crawled = crawl_filtered_pages(home_url, category_choice)
+        # keep the crawl per (homepage, category) so editing only the targets doesn't re-crawl
+        crawl_key = f"crawl::{home_url}::{category_choice}"
+        crawled = None if recrawl else st.session_state.get(crawl_key)
+        if not crawled:
+            with st.spinner(f"🚀 Crawling up to 300 pages from {category_choice}..."):
+                # Re-crawl only invalidates the cache entries for the URLs this crawl fetches
+                crawled = crawl_filtered_pages(home_url, category_choice, refresh=recrawl)
+            # an empty crawl is not remembered, so the next click simply tries again
+            if crawled:
+                st.session_state[crawl_key] = crawled
 
         if not crawled:
             st.warning("😕 No matching pages found during crawl.")
         else:
             st.success(f"✅ Crawled {len(crawled)} pages. Now checking for links to your targets...")
 
-            # Slightly optimized matching
-            targets_set = set(t.rstrip('/') for t in target_urls)
+            # targets are normalised once at input, so each link costs one set lookup
+            targets_set = frozenset(target_urls)
             matches_by_target = {target: [] for target in targets_set}
 
             for page, links in crawled:
                 for link, anchor in links:
-                    link_norm = link.rstrip('/')
+                    link_norm = link.rstrip('/') if link.endswith('/') else link
                     if link_norm in targets_set:
                         matches_by_target[link_norm].append((page, anchor))
 
@@ -340,8 +525,7 @@ if st.button("Check Interlinking Pages"):
                 st.success(f"🔗 Found {total_found} total links to your targets.\n")
 
                 for target in target_urls:
-                    key = target.rstrip('/')
-                    matches = matches_by_target.get(key, [])
+                    matches = matches_by_target.get(target, [])
                     st.markdown(f"### 🎯 Target URL: `{target}`")
                     if matches:
                         for page, anchor in matches:
@@ -0,0 +1,90 @@
+import io
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import interlinking
+
+
+def _response(body, content_type="text/html", status=200):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers = CaseInsensitiveDict({"Content-Type": content_type})
+    resp.raw = io.BytesIO(body)
+    return resp
+
+
+def _serve(monkeypatch, body, content_type="text/html"):
+    monkeypatch.setattr(interlinking.SESSION, "get", lambda url, **kw: _response(body, content_type))
+
+
+def test_utf8_anchor_text_uses_header_charset(monkeypatch):
+    # no <meta charset>: only the HTTP header says utf-8
+    body = '<html><body><a href="/x">Café – naïve</a></body></html>'.encode("utf-8")
+    _serve(monkeypatch, body, "text/html; charset=utf-8")
+    links = interlinking._fetch_internal_links("https://example.com/page")
+    assert links == [("https://example.com/x", "Café – naïve")]
+
+
+def test_sitemap_ignores_image_and_video_locs():
+    xml = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"
+        xmlns:video="http://www.google.com/schemas/sitemap-video/1.1">
+  <url>
+    <loc>https://example.com/blog/first</loc>
+    <image:image><image:loc>https://example.com/blog/0.png</image:loc></image:image>
+    <image:image><image:loc>https://example.com/blog/1.png</image:loc></image:image>
+  </url>
+  <url>
+    <loc>https://example.com/blog/second</loc>
+    <video:video><video:content_loc>https://example.com/v.mp4</video:content_loc>
+      <video:player_loc>https://example.com/player</video:player_loc></video:video>
+  </url>
+</urlset>"""
+    root_tag, locs = interlinking._parse_sitemap_xml(io.BytesIO(xml))
+    assert root_tag == "urlset"
+    assert locs == ["https://example.com/blog/first", "https://example.com/blog/second"]
+
+
+def test_sitemap_index_locs_are_kept():
+    xml = b"""<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.com/post-sitemap.xml</loc></sitemap>
+  <sitemap><loc>https://example.com/page-sitemap.xml</loc></sitemap>
+</sitemapindex>"""
+    root_tag, locs = interlinking._parse_sitemap_xml(io.BytesIO(xml))
+    assert root_tag == "sitemapindex"
+    assert locs == ["https://example.com/post-sitemap.xml", "https://example.com/page-sitemap.xml"]
+
+
+def test_retry_ignores_long_retry_after():
+    import time
+    from urllib3.response import HTTPResponse
+
+    resp = HTTPResponse(body=b"", status=429, headers={"Retry-After": "600"}, preload_content=False)
+    retry = interlinking._RETRY.increment(method="GET", url="/", response=resp)
+    start = time.monotonic()
+    retry.sleep(resp)
+    assert time.monotonic() - start < 5
+
+
+def test_failed_robots_fetch_is_not_cached(monkeypatch):
+    home = "https://robots-retry.example.com"
+
+    def down(url, **kw):
+        raise requests.ConnectionError("network down")
+
+    monkeypatch.setattr(interlinking.SESSION, "get", down)
+    assert interlinking._robots_checker(home)(home + "/private/page")
+
+    robots = b"User-agent: *\nDisallow: /private\nSitemap: https://robots-retry.example.com/s.xml\n"
+    _serve(monkeypatch, robots, "text/plain")
+    assert not interlinking._robots_checker(home)(home + "/private/page")
+    assert interlinking._discover_sitemaps_from_robots(home) == [home + "/s.xml"]
+
+
+def test_missing_robots_txt_allows_everything(monkeypatch):
+    home = "https://no-robots.example.com"
+    monkeypatch.setattr(interlinking.SESSION, "get", lambda url, **kw: _response(b"", status=404))
+    assert interlinking._robots_checker(home)(home + "/anything")
+    assert interlinking._discover_sitemaps_from_robots(home) == []